@@ -11,6 +11,11 @@ a = Analysis(
     'tkinter.messagebox',
     'customtkinter',
     'pyodbc',
+    'socc_db',
+    'socc_auth',
+    'socc_client',
+    'socc_model',
+    'socc_snapshot',
     'tksheet',
     'dotenv',
     'ldap3',
@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+import time
+
+from ldap3 import NONE, NTLM, SUBTREE, SYNC, Connection, Server
+from ldap3.core.exceptions import LDAPException
+from ldap3.utils.dn import parse_dn
+
+
+def normalize_dn(dn):
+    # Lowercase with the blanks around separators removed, so equal DNs compare equal
+    dn = str(dn).strip()
+    try:
+        return ",".join(f"{attr}={value}" for attr, value, _ in parse_dn(dn, strip=True)).lower()
+    except LDAPException:
+        return dn.lower()
+
+
+def group_keys(dn):
+    # A group matches ALLOWED_GROUPS by its full DN, by CN=name or by the bare name
+    dn = normalize_dn(dn)
+    keys = {dn}
+    attr, _, value = dn.split(",")[0].partition("=")
+    if attr == "cn":
+        keys.add(value)
+        keys.add(f"cn={value}")
+    return keys
+
+
+def parse_allowed_groups(value):
+    # ALLOWED_GROUPS holds full group DNs joined by commas, so the setting is split into
+    # RDNs and every CN= starts a new group. Entries without "=" are bare group names.
+    groups = []
+    for token in (value or "").split(","):
+        token = token.strip()
+        if not token:
+            continue
+        if "=" not in token:
+            groups.append([token])
+        elif token.lower().startswith("cn=") or not groups or "=" not in groups[-1][0]:
+            groups.append([token])
+        else:
+            groups[-1].append(token)
+    return [",".join(rdns) for rdns in groups]
+
+
+def escape_filter(value):
+    # RFC 4515 escaping so a username cannot change the search filter
+    for char, escaped in (("\\", r"\5c"), ("*", r"\2a"), ("(", r"\28"), (")", r"\29"), ("\0", r"\00")):
+        value = value.replace(char, escaped)
+    return value
+
+
+class LdapAuthorizer:
+    # One server definition and one connection reused across logins. Each login binds
+    # as the user, which checks the password, and the memberOf search is skipped while
+    # the user's authorization decision is still cached.
+    def __init__(
+        self,
+        server,
+        domain,
+        allowed_users=(),
+        allowed_groups=(),
+        search_base=None,
+        cache_ttl=300.0,
+        authentication=NTLM,
+        client_strategy=SYNC,
+        connect_timeout=5,
+    ):
+        # get_info=NONE skips downloading the schema and DSA info on every connect
+        self.server = server if isinstance(server, Server) else Server(
+            server, get_info=NONE, connect_timeout=connect_timeout)
+        self.domain = domain
+        self.allowed_users = {user.strip().lower() for user in allowed_users if user.strip()}
+        # Resolved once, membership is then a set lookup per group of the user
+        self.allowed_groups = {
+            normalize_dn(group) if "=" in group else group.strip().lower()
+            for group in allowed_groups
+            if group.strip()
+        }
+        self.search_base = search_base or "DC=" + domain.replace(".", ",DC=")
+        self.cache_ttl = cache_ttl
+        self.authentication = authentication
+        self.client_strategy = client_strategy
+        self._conn = None
+        self._cache = {}  # username -> (expires at, allowed)
+        self._lock = threading.Lock()
+
+    def bind_user(self, username):
+        if self.authentication == NTLM:
+            return f"{self.domain}\\{username}"
+        return username
+
+    def authenticate(self, username, password):
+        if not username or not password:
+            # An empty password would be an anonymous bind and always succeed
+            return False
+        key = username.strip().lower()
+        with self._lock:
+            try:
+                start = time.perf_counter()
+                bound = self._bind(username, password)
+                bind_time = time.perf_counter() - start
+                if not bound:
+                    logging.warning(f"LDAP bind failed for {username} ({bind_time:.3f}s).")
+                    return False
+                logging.info(f"LDAP bind successful for {username} ({bind_time:.3f}s).")
+
+                cached = self._cache.get(key)
+                if key in self.allowed_users:
+                    allowed = True
+                elif cached is not None and cached[0] > time.monotonic():
+                    allowed = cached[1]
+                    logging.info(f"Authorization for {username} served from cache.")
+                else:
+                    start = time.perf_counter()
+                    allowed = self._authorize(username)
+                    logging.info(f"LDAP search for {username} took {time.perf_counter() - start:.3f}s.")
+                    if allowed is not None:
+                        self._cache[key] = (time.monotonic() + self.cache_ttl, allowed)
+            except LDAPException as e:
+                logging.error(f"LDAP error for {username}: {e}")
+                self._drop_connection()
+                allowed = False
+
+        if not allowed:
+            logging.warning(f"Access denied for {username}.")
+        return bool(allowed)
+
+    def invalidate(self, username=None):
+        with self._lock:
+            if username is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(username.strip().lower(), None)
+
+    def _bind(self, username, password):
+        user = self.bind_user(username)
+        if self._conn is None:
+            self._conn = Connection(
+                self.server,
+                user=user,
+                password=password,
+                authentication=self.authentication,
+                client_strategy=self.client_strategy,
+                raise_exceptions=False,
+            )
+            self._conn.open()
+            return self._conn.bind(read_server_info=False)
+        # Re-authenticate on the open connection instead of connecting again
+        if self._conn.closed:
+            self._conn.open()
+        return self._conn.rebind(
+            user=user, password=password, authentication=self.authentication, read_server_info=False)
+
+    def _authorize(self, username):
+        # None means the user was not found, that decision is not cached
+        self._conn.search(
+            self.search_base,
+            f"(sAMAccountName={escape_filter(username)})",
+            search_scope=SUBTREE,
+            attributes=["memberOf"],
+            size_limit=1,
+        )
+        if not self._conn.entries:
+            logging.warning(f"User {username} not found in LDAP search.")
+            return None
+        for entry in self._conn.entries:
+            if "memberOf" not in entry.entry_attributes:
+                continue
+            for dn in entry.memberOf.values:
+                if not self.allowed_groups.isdisjoint(group_keys(dn)):
+                    return True
+        return False
+
+    def _drop_connection(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.unbind()
+            except LDAPException:
+                pass
+
+
+def split_setting(value):
+    return [item for item in (value or "").split(",") if item.strip()]
+
+
+def create_authorizer_from_env():
+    return LdapAuthorizer(
+        os.getenv("AD_SERVER"),
+        os.getenv("AD_DOMAIN"),
+        allowed_users=split_setting(os.getenv("ALLOWED_USERS")),
+        allowed_groups=parse_allowed_groups(os.getenv("ALLOWED_GROUPS")),
+        search_base=os.getenv("AD_SEARCH_BASE") or None,
+        cache_ttl=float(os.getenv("AD_AUTH_CACHE_TTL", "300")),
+        connect_timeout=int(os.getenv("AD_CONNECT_TIMEOUT", "5")),
+    )
+
+
+_authorizer = None
+_authorizer_lock = threading.Lock()
+
+
+def get_authorizer():
+    global _authorizer
+    with _authorizer_lock:
+        if _authorizer is None:
+            _authorizer = create_authorizer_from_env()
+        return _authorizer
+
+
+def set_authorizer(authorizer):
+    # Swap the shared authorizer, e.g. for one using the MOCK_SYNC strategy in tests
+    global _authorizer
+    with _authorizer_lock:
+        _authorizer = authorizer
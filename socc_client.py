@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+import zlib
+
+from socc_db import MAX_TRACKING_UIDS, decode_json_value
+
+
+class ServiceError(Exception):
+    pass
+
+
+class ServiceClient:
+    # Talks to socc_service instead of SQL Server. Only the standard library is used
+    # so the desktop build does not need Flask.
+    def __init__(self, base_url, token=None, timeout=30.0):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def headers(self, headers):
+        # The service rejects requests without its shared token
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def open_tab(self, tab, etag=None):
+        # Returns the streaming response, or None when etag is still current
+        headers = self.headers({"Accept-Encoding": "gzip"})
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        request = urllib.request.Request(f"{self.base_url}/tabs/{tab}?format=ndjson", headers=headers)
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise ServiceError(f"{tab}: HTTP {e.code} {e.reason}") from e
+        except OSError as e:
+            raise ServiceError(f"{tab}: {e}") from e
+
+    def changed(self, tab, etag):
+        response = self.open_tab(tab, etag)
+        if response is None:
+            return False
+        response.close()
+        return True
+
+    def upsert_tracking(self, uids, ocfstate, comments, insert_only=False):
+        # Same contract as socc_db.upsert_tracking, the service runs the MERGE. It takes
+        # at most MAX_TRACKING_UIDS per request, so larger saves go in several requests,
+        # each one its own transaction.
+        uids = list(uids)
+        inserted, updated = [], []
+        for start in range(0, len(uids), MAX_TRACKING_UIDS):
+            try:
+                chunk_inserted, chunk_updated = self.post_tracking(
+                    uids[start:start + MAX_TRACKING_UIDS], ocfstate, comments, insert_only)
+            except ServiceError as e:
+                if start:
+                    raise ServiceError(f"{e} ({len(inserted) + len(updated)} records already saved)") from e
+                raise
+            inserted.extend(chunk_inserted)
+            updated.extend(chunk_updated)
+        return inserted, updated
+
+    def post_tracking(self, uids, ocfstate, comments, insert_only):
+        body = json.dumps({
+            "uids": uids,
+            "ocfstate": ocfstate,
+            "comments": comments,
+            "insert_only": insert_only,
+        }).encode()
+        request = urllib.request.Request(
+            f"{self.base_url}/tracking",
+            data=body,
+            headers=self.headers({"Content-Type": "application/json"}),
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                result = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise ServiceError(f"tracking: HTTP {e.code} {e.reason}") from e
+        except (OSError, ValueError) as e:
+            raise ServiceError(f"tracking: {e}") from e
+        return result["inserted"], result["updated"]
+
+
+class ServiceStream:
+    # Drop-in for StreamedQuery that reads a tab from the service. query is the SQL the
+    # service runs for the tab, it only keys the local snapshot. etag is set once the
+    # response headers arrive.
+    def __init__(self, client, tab, query, batch_size=None):
+        self.client = client
+        self.tab = tab
+        self.query = query
+        self.batch_size = batch_size or int(os.getenv("DB_FETCH_BATCH", "1000"))
+        self.cancelled = threading.Event()
+        self.etag = None
+        self._response = None
+
+    def batches(self):
+        if self.cancelled.is_set():
+            return
+        response = self.client.open_tab(self.tab)
+        self._response = response
+        self.etag = response.headers.get("ETag")
+        gzipped = response.headers.get("Content-Encoding") == "gzip"
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+        pending = b""
+        batch = []
+        try:
+            while not self.cancelled.is_set():
+                chunk = response.read(64 * 1024)
+                if not chunk:
+                    break
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    if line:
+                        batch.append(json.loads(line, object_hook=decode_json_value))
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+            if pending.strip() and not self.cancelled.is_set():
+                batch.append(json.loads(pending, object_hook=decode_json_value))
+            if batch and not self.cancelled.is_set():
+                yield batch
+        except (OSError, ValueError, zlib.error) as e:
+            raise ServiceError(f"{self.tab}: {e}") from e
+        finally:
+            self._response = None
+            response.close()
+
+    def cancel(self):
+        self.cancelled.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except OSError:
+                pass
@@ -0,0 +1,577 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+try:
+    import pyodbc
+except ImportError:  # Only the SQLite stand-in is available
+    pyodbc = None
+
+
+# SQLSTATE codes that mean the connection itself is gone
+DISCONNECT_STATES = ("08S01", "08001", "08003", "08004", "08007")
+
+
+def build_connection_string(prefix="DB1"):
+    return (
+        f"DRIVER={os.getenv(f'{prefix}_DRIVER')};"
+        f"SERVER={os.getenv(f'{prefix}_SERVER')};"
+        f"DATABASE={os.getenv(f'{prefix}_DATABASE')};"
+        f"UID={os.getenv(f'{prefix}_UID')};"
+        f"PWD={os.getenv(f'{prefix}_PWD')}"
+    )
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Errors raised by any of the supported backends or by the pool itself
+DB_ERRORS = (sqlite3.Error, PoolTimeout) if pyodbc is None else (pyodbc.Error, sqlite3.Error, PoolTimeout)
+
+
+class PyodbcBackend:
+    def __init__(self, conn_str, login_timeout=15):
+        if pyodbc is None:
+            raise RuntimeError("pyodbc is not installed")
+        self.conn_str = conn_str
+        self.login_timeout = login_timeout
+        self.errors = (pyodbc.Error,)
+
+    def connect(self):
+        return pyodbc.connect(self.conn_str, timeout=self.login_timeout)
+
+    def ping(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        finally:
+            cursor.close()
+
+    def is_disconnect(self, error):
+        return bool(error.args) and str(error.args[0]) in DISCONNECT_STATES
+
+
+class SQLiteBackend:
+    # Local stand-in used by the tests for the pool and the streaming. The tab queries are
+    # SQL Server only (dbo., COLLATE, TOP, CHECKSUM_AGG, MERGE), so the app cannot load on it.
+    def __init__(self, database="socc_test.db"):
+        self.database = database
+        self.errors = (sqlite3.Error,)
+
+    def connect(self):
+        return sqlite3.connect(
+            self.database,
+            uri=self.database.startswith("file:"),
+            check_same_thread=False,
+        )
+
+    def ping(self, conn):
+        conn.execute("SELECT 1").fetchone()
+
+    def is_disconnect(self, error):
+        return isinstance(error, sqlite3.ProgrammingError)
+
+
+class ConnectionPool:
+    def __init__(self, backend, max_size=4, timeout=30.0, health_check_interval=60.0):
+        self.backend = backend
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = []  # (connection, last time it was returned)
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.stats = {"connects": 0, "reuses": 0, "waits": 0, "wait_time": 0.0, "discarded": 0}
+
+    def acquire(self):
+        start = time.monotonic()
+        waited = False
+        conn = None
+        last_used = 0.0
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("The connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve the slot now, connect outside the lock
+                    self._size += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise PoolTimeout(f"No connection available after {self.timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self.stats["waits"] += 1
+                self.stats["wait_time"] += time.monotonic() - start
+
+        # Health check connections that sat idle for a while before handing them out
+        if conn is not None and time.monotonic() - last_used >= self.health_check_interval:
+            try:
+                self.backend.ping(conn)
+            except self.backend.errors:
+                self._close_quietly(conn)
+                conn = None
+                with self._cond:
+                    self.stats["discarded"] += 1
+
+        if conn is None:
+            try:
+                conn = self.backend.connect()
+            except BaseException:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.stats["connects"] += 1
+        else:
+            with self._cond:
+                self.stats["reuses"] += 1
+        return conn
+
+    def release(self, conn, broken=False):
+        if not broken:
+            try:
+                # Never hand out a connection with a pending transaction
+                conn.rollback()
+            except self.backend.errors:
+                broken = True
+        with self._cond:
+            if broken or self._closed:
+                self._size -= 1
+                if broken:
+                    self.stats["discarded"] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except self.backend.errors as e:
+            self.release(conn, broken=self.backend.is_disconnect(e))
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def run(self, work, retries=1):
+        # Run work(conn), reconnecting and retrying when the link dropped mid-call
+        while True:
+            try:
+                with self.connection() as conn:
+                    return work(conn)
+            except self.backend.errors as e:
+                if retries <= 0 or not self.backend.is_disconnect(e):
+                    raise
+                retries -= 1
+
+    def get_stats(self):
+        with self._cond:
+            return dict(self.stats, size=self._size, idle=len(self._idle))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._size -= len(idle)
+            self._idle = []
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# Typed cell values in JSON, shared by the local snapshots and the caching service
+def encode_json_value(value):
+    if isinstance(value, datetime.datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"n": str(value)}
+    raise TypeError(f"Cannot encode {type(value).__name__} as JSON")
+
+
+def decode_json_value(obj):
+    if "dt" in obj:
+        return datetime.datetime.fromisoformat(obj["dt"])
+    if "d" in obj:
+        return datetime.date.fromisoformat(obj["d"])
+    if "n" in obj:
+        return Decimal(obj["n"])
+    return obj
+
+
+# Tracking rows joined to the purchase order lines
+OC_QUERY = """
+    SELECT
+        vw_in_ordeabasdeta_with_uid.UID,
+        vw_in_ordeabasdeta_with_uid.[# OC],
+        vw_in_ordeabasdeta_with_uid.[CODIGO ITEM],
+        vw_in_ordeabasdeta_with_uid.[DESCRIPCION ITEM],
+        vw_in_ordeabasdeta_with_uid.[NIT PROVEEDOR],
+        vw_in_ordeabasdeta_with_uid.[DESCRIPCION PROVEEDOR],
+        vw_in_ordeabasdeta_with_uid.[UNIDADES PEDIDAS],
+        vw_in_ordeabasdeta_with_uid.[VALOR NETO],
+        vw_in_ordeabasdeta_with_uid.[FECHA COMPROMETIDA],
+        vw_in_ordeabasdeta_with_uid.[FECHA REQUERIDA],
+        vw_in_ordeabasdeta_with_uid.[ESTADO OC],
+        CON_SEG_OC.OCFSTATE,
+        CON_SEG_OC.COMMENTS
+    FROM dbo.vw_in_ordeabasdeta_with_uid
+    LEFT OUTER JOIN dbo.CON_SEG_OC
+        ON vw_in_ordeabasdeta_with_uid.UID = CON_SEG_OC.UID COLLATE Latin1_General_CI_AS
+"""
+
+# Tracking rows for negative inventory items that have no purchase order yet
+NOC_QUERY = """
+    SELECT
+        CONCAT(vw_Negativos.OP, vw_Negativos.item) AS UID
+        ,vw_Negativos.OP AS [# OP]
+        ,vw_Negativos.item AS [CODIGO ITEM]
+        ,in_items.itedesccort AS [DESCRIPCION ITEM]
+        ,NULL AS [NIT PROVEEDOR]
+        ,NULL AS [DESCRIPCION PROVEEDOR]
+        ,(vw_Negativos.Diferencia*-1) AS [UNIDADES PENDIENTES]
+        ,NULL AS [VALOR NETO]
+        ,NULL AS [FECHA COMPROMETIDA]
+        ,NULL AS [FECHA REQUERIDA]
+        ,NULL AS [ESTADO OC]
+        ,CON_SEG_OC.OCFSTATE
+        ,CON_SEG_OC.COMMENTS
+        FROM SIIAPP.dbo.vw_Negativos
+        LEFT OUTER JOIN SIIAPP.dbo.vw_in_ordeabasdeta_with_uid
+        ON vw_Negativos.item = vw_in_ordeabasdeta_with_uid.[CODIGO ITEM]
+        LEFT OUTER JOIN SIIAPP.dbo.CON_SEG_OC
+        ON CONCAT(vw_Negativos.OP, vw_Negativos.item) = CON_SEG_OC.UID COLLATE Latin1_General_CI_AS
+        INNER JOIN ssf_genericos.dbo.V_fp_pedidos
+        ON V_fp_pedidos.OP = vw_Negativos.OP
+        INNER JOIN ssf_genericos.dbo.in_items
+        ON vw_Negativos.item = in_items.itecodigo
+        WHERE vw_in_ordeabasdeta_with_uid.[# OC] IS NULL
+        AND in_items.itecompania = 01
+"""
+NOC_ORDER_BY = "ORDER BY vw_in_ordeabasdeta_with_uid.[# OC], [CODIGO ITEM]"
+
+# Columns that tell rows of a tab apart, the last PagedQuery sort keys. An OC line has
+# its own UID. A NOC UID repeats once per matching vw_in_ordeabasdeta_with_uid and
+# V_fp_pedidos row, but no column of those views is selected, so the repeats are
+# identical apart from the pending units of vw_Negativos. CON_SEG_OC has one row per
+# UID, the saves MERGE on it.
+OC_TIE_COLUMNS = [0]
+NOC_TIE_COLUMNS = [0, 6]
+
+# Column names of each tab query as seen from a wrapping SELECT ... FROM (query) q
+OC_COLUMNS = [
+    "UID", "[# OC]", "[CODIGO ITEM]", "[DESCRIPCION ITEM]", "[NIT PROVEEDOR]",
+    "[DESCRIPCION PROVEEDOR]", "[UNIDADES PEDIDAS]", "[VALOR NETO]", "[FECHA COMPROMETIDA]",
+    "[FECHA REQUERIDA]", "[ESTADO OC]", "OCFSTATE", "COMMENTS",
+]
+NOC_COLUMNS = [
+    "UID", "[# OP]", "[CODIGO ITEM]", "[DESCRIPCION ITEM]", "[NIT PROVEEDOR]",
+    "[DESCRIPCION PROVEEDOR]", "[UNIDADES PENDIENTES]", "[VALOR NETO]", "[FECHA COMPROMETIDA]",
+    "[FECHA REQUERIDA]", "[ESTADO OC]", "OCFSTATE", "COMMENTS",
+]
+
+
+def like_pattern(term):
+    # Match term anywhere, with LIKE wildcards in the term taken literally
+    escaped = term.replace("[", "[[]").replace("%", "[%]").replace("_", "[_]")
+    return f"%{escaped}%"
+
+
+def build_search_filter(columns, search_columns, free_text, column_terms):
+    # Same rules as the client side search: free text in any search column and
+    # every column term in its column, case and accent insensitive
+    clauses = []
+    params = []
+
+    def matches(col):
+        return f"CAST(q.{columns[col]} AS NVARCHAR(4000)) COLLATE Latin1_General_CI_AI LIKE ?"
+
+    if free_text:
+        clauses.append("(" + " OR ".join(matches(col) for col in search_columns) + ")")
+        params.extend([like_pattern(free_text)] * len(search_columns))
+    for col, term in column_terms.items():
+        clauses.append(matches(col))
+        params.append(like_pattern(term))
+    return " AND ".join(clauses), params
+
+
+class PagedQuery:
+    # Pages over a tab query with the search and the sort pushed down. Rows are numbered
+    # with ROW_NUMBER() over the sort followed by tie_columns, which must tell apart every
+    # two rows that differ, and page n is then rows n*size+1 .. (n+1)*size. Rows that still
+    # tie are identical, so it does not matter which of them gets which number.
+    def __init__(self, base_query, columns, sort_keys=(), search_sql="", search_params=(), tie_columns=(0,)):
+        self.base_query = base_query
+        self.columns = columns
+        self.sort_keys = list(sort_keys)
+        self.search_sql = search_sql
+        self.search_params = list(search_params)
+        self.tie_columns = list(tie_columns)
+
+    def order_by(self):
+        terms = [f"q.{self.columns[col]} {'DESC' if descending else 'ASC'}" for col, descending in self.sort_keys]
+        terms.extend(f"q.{self.columns[col]} ASC" for col in self.tie_columns)
+        return "ORDER BY " + ", ".join(terms)
+
+    def where(self):
+        return f"WHERE {self.search_sql}" if self.search_sql else ""
+
+    def count(self, pool=None):
+        query = f"SELECT COUNT(*) FROM ({self.base_query}) q {self.where()}"
+        return fetch_all(query, self.search_params, pool)[0][0]
+
+    def fetch_range(self, start, limit, pool=None):
+        # Rows at positions start .. start+limit-1 of the sorted result, without the row number
+        query = (
+            f"SELECT w.* FROM ("
+            f"SELECT q.*, ROW_NUMBER() OVER ({self.order_by()}) AS SOCC_ROW "
+            f"FROM ({self.base_query}) q {self.where()}"
+            f") w WHERE w.SOCC_ROW > ? AND w.SOCC_ROW <= ? ORDER BY w.SOCC_ROW"
+        )
+        rows = fetch_all(query, self.search_params + [start, start + limit], pool)
+        return [list(row[:-1]) for row in rows]
+
+
+def fetch_all(query, params=(), pool=None):
+    # One-shot query, run again on a new connection if the link dropped during it
+    def work(conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    return (pool or get_pool()).run(work)
+
+
+# Delta refresh: rows are grouped into buckets by the end of their UID and the server
+# returns one CHECKSUM_AGG per bucket. Only buckets whose checksum or row count moved
+# since the last sync are fetched again. uid_bucket() computes the same key client side.
+BUCKET_SQL = "UPPER(RIGHT(RTRIM(q.UID), 2))"
+
+# Above this many changed buckets a full reload is cheaper than the IN (...) list
+MAX_DELTA_BUCKETS = 200
+
+
+def uid_bucket(uid):
+    return uid.rstrip()[-2:].upper()
+
+
+def probe_checksums(base_query, pool=None):
+    query = (
+        f"SELECT {BUCKET_SQL} AS BUCKET, CHECKSUM_AGG(BINARY_CHECKSUM(*)) AS CHK, COUNT(*) AS N "
+        f"FROM ({base_query}) q GROUP BY {BUCKET_SQL}"
+    )
+    return {row[0]: (row[1], row[2]) for row in fetch_all(query, pool=pool)}
+
+
+def changed_buckets(old, new):
+    return {bucket for bucket in old.keys() | new.keys() if old.get(bucket) != new.get(bucket)}
+
+
+def fetch_buckets(base_query, buckets, pool=None):
+    placeholders = ", ".join("?" for _ in buckets)
+    query = f"SELECT q.* FROM ({base_query}) q WHERE {BUCKET_SQL} IN ({placeholders})"
+    return fetch_all(query, list(buckets), pool)
+
+
+class StreamedQuery:
+    # Runs a query on a pooled connection and yields it in fetchmany() batches.
+    # cancel() may be called from another thread to stop a slow query.
+    def __init__(self, query, params=(), batch_size=None, pool=None):
+        self.query = query
+        self.params = params
+        self.batch_size = batch_size or int(os.getenv("DB_FETCH_BATCH", "1000"))
+        self.pool = pool
+        self.cancelled = threading.Event()
+        self._cursor = None
+        self._conn = None
+
+    def batches(self):
+        pool = self.pool or get_pool()
+        retries = 1
+        while True:
+            started = False
+            try:
+                with pool.connection() as conn:
+                    cursor = conn.cursor()
+                    self._conn, self._cursor = conn, cursor
+                    try:
+                        if self.cancelled.is_set():
+                            return
+                        cursor.execute(self.query, self.params)
+                        while not self.cancelled.is_set():
+                            rows = cursor.fetchmany(self.batch_size)
+                            if not rows:
+                                break
+                            started = True
+                            yield rows
+                    finally:
+                        self._conn, self._cursor = None, None
+                        cursor.close()
+                return
+            except pool.backend.errors as e:
+                # Start over on a new connection only while no batch has been handed out
+                if started or retries <= 0 or self.cancelled.is_set() or not pool.backend.is_disconnect(e):
+                    raise
+                retries -= 1
+
+    def cancel(self):
+        self.cancelled.set()
+        cursor, conn = self._cursor, self._conn
+        try:
+            if cursor is not None and hasattr(cursor, "cancel"):
+                cursor.cancel()
+            elif conn is not None and hasattr(conn, "interrupt"):
+                conn.interrupt()
+        except DB_ERRORS:
+            pass
+
+
+# Values offered for CON_SEG_OC.OCFSTATE
+TRACKING_STATES = ["Cartera", "Homologacion", "Cotizacion", "Diseño", "Suministrado Por Cliente"]
+
+# Most UIDs the service saves per /tracking request, clients split larger saves
+MAX_TRACKING_UIDS = 5000
+
+# Bulk save of tracking records: the selected UIDs are staged in a temp table and a
+# single MERGE inserts or updates them all in one transaction. The UID columns do not
+# share one collation, so the match names it explicitly like the tab query joins do.
+SEG_STAGE_SQL = """
+    IF OBJECT_ID('tempdb..#SEG_UIDS') IS NOT NULL DROP TABLE #SEG_UIDS;
+    CREATE TABLE #SEG_UIDS (UID NVARCHAR(200) COLLATE DATABASE_DEFAULT PRIMARY KEY)
+"""
+SEG_MERGE_SQL = """
+    MERGE dbo.CON_SEG_OC WITH (HOLDLOCK) AS t
+    USING #SEG_UIDS AS s
+        ON t.UID = s.UID COLLATE Latin1_General_CI_AS
+    {clauses}
+    OUTPUT $action, inserted.UID;
+"""
+
+
+def tracking_merge(ocfstate, comments, insert_only=False):
+    # Builds the MERGE for upsert_tracking, or returns None when it has nothing to do.
+    # A None field is left out, so existing records keep their value. A missing record
+    # is inserted only when a state is given, edits without one just update.
+    fields = [(name, value) for name, value in (("OCFSTATE", ocfstate), ("COMMENTS", comments)) if value is not None]
+    clauses = []
+    params = []
+    if not insert_only and fields:
+        clauses.append("WHEN MATCHED THEN UPDATE SET " + ", ".join(f"{name} = ?" for name, _ in fields))
+        params.extend(value for _, value in fields)
+    if ocfstate:
+        clauses.append(
+            f"WHEN NOT MATCHED BY TARGET THEN INSERT (UID, {', '.join(name for name, _ in fields)}) "
+            f"VALUES (s.UID, {', '.join('?' for _ in fields)})"
+        )
+        params.extend(value for _, value in fields)
+    if not clauses:
+        return None
+    return SEG_MERGE_SQL.format(clauses="\n    ".join(clauses)), params
+
+
+def upsert_tracking(uids, ocfstate, comments, insert_only=False, pool=None):
+    # Returns (inserted, updated) UID lists. ocfstate or comments None leaves that field
+    # as it is. With insert_only existing records are left untouched and show up in
+    # neither list, and the same goes for missing ones when no state is given.
+    # The UID comparison is case insensitive and ignores trailing blanks, report the
+    # UIDs back exactly as the caller passed them
+    originals = {}
+    for uid in uids:
+        originals.setdefault(uid.rstrip().upper(), uid)
+    uids = list(originals.values())
+    merge = tracking_merge(ocfstate, comments, insert_only)
+    if not uids or merge is None:
+        return [], []
+    query, params = merge
+
+    def work(conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(SEG_STAGE_SQL)
+            if hasattr(cursor, "fast_executemany"):
+                cursor.fast_executemany = True
+            cursor.executemany("INSERT INTO #SEG_UIDS (UID) VALUES (?)", [(uid,) for uid in uids])
+            cursor.execute(query, params)
+            actions = cursor.fetchall()
+            cursor.execute("DROP TABLE #SEG_UIDS")
+            conn.commit()
+        finally:
+            cursor.close()
+        result = {"INSERT": [], "UPDATE": []}
+        for action, uid in actions:
+            result[action].append(originals.get(uid.rstrip().upper(), uid))
+        return result["INSERT"], result["UPDATE"]
+
+    return (pool or get_pool()).run(work)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def create_pool_from_env():
+    if os.getenv("DB_BACKEND", "pyodbc").lower() == "sqlite":
+        backend = SQLiteBackend(os.getenv("DB_SQLITE_PATH", "socc_test.db"))
+    else:
+        backend = PyodbcBackend(build_connection_string("DB1"))
+    return ConnectionPool(
+        backend,
+        max_size=int(os.getenv("DB_POOL_SIZE", "4")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK", "60")),
+    )
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = create_pool_from_env()
+        return _pool
+
+
+def set_pool(pool):
+    # Swap the shared pool, e.g. for one backed by SQLiteBackend in tests
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, pool
+    if old is not None and old is not pool:
+        old.close()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, None
+    if old is not None:
+        old.close()
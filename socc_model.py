@@ -0,0 +1,279 @@
+import datetime
+import re
+import sys
+import unicodedata
+from array import array
+from decimal import Decimal
+
+from socc_db import uid_bucket
+
+# Search and table logic behind MyFrame. Nothing here touches Tk, so it can run on the
+# loader threads and be tested without a display.
+
+# Columns covered by the search box
+SEARCH_COLUMNS = (1, 2, 3, 4, 5)
+
+# Prefixes for per-column filters, e.g. "nit:900123 proveedor:acme"
+FILTER_PREFIXES = {
+    "oc": 1,
+    "op": 1,
+    "codigo": 2,
+    "item": 3,
+    "nit": 4,
+    "proveedor": 5,
+    "estado": 11,
+}
+FILTER_TERM = re.compile(r'(\w+):(?:"([^"]*)"|(\S+))')
+
+def normalize_text(value):
+    # Lowercase and strip accents so "Diseño" also matches "diseno"
+    text = "" if value is None else str(value).lower()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def parse_search(text):
+    column_terms = {}
+
+    def take(match):
+        col = FILTER_PREFIXES.get(normalize_text(match.group(1)))
+        if col is None:
+            return match.group(0)
+        value = match.group(2) if match.group(2) is not None else match.group(3)
+        column_terms[col] = normalize_text(value)
+        return " "
+
+    free_text = FILTER_TERM.sub(take, text)
+    if column_terms:
+        free_text = " ".join(free_text.split())
+    return normalize_text(free_text.strip()), column_terms
+
+
+class SearchIndex:
+    # Built once per load, off the Tk thread. Holds the normalized keys of the searchable
+    # columns for every row and a trigram inverted index over them. Results are row
+    # positions in the list the index was built from.
+    def __init__(self, rows):
+        self.column_keys = {col: [] for col in SEARCH_COLUMNS}
+        self.keys = []
+        self.trigrams = {}
+        for i, row in enumerate(rows):
+            parts = []
+            for col in SEARCH_COLUMNS:
+                key = normalize_text(row[col])
+                self.column_keys[col].append(key)
+                parts.append(key)
+            # The separator keeps a match from spanning two columns
+            key = "\x1f".join(parts)
+            self.keys.append(key)
+            for gram in {key[j:j + 3] for j in range(len(key) - 2)}:
+                postings = self.trigrams.get(gram)
+                if postings is None:
+                    postings = self.trigrams[gram] = array("I")
+                postings.append(i)
+        self.last_query = None
+        self.last_result = None
+
+    def search(self, rows, text):
+        free_text, column_terms = parse_search(text)
+        query = (free_text, column_terms)
+
+        candidates = None
+        if self.last_query is not None and self.narrows(self.last_query, query):
+            candidates = set(self.last_result)
+
+        terms = [free_text] + [term for col, term in column_terms.items() if col in self.column_keys]
+        postings = [
+            self.trigrams.get(term[j:j + 3], ())
+            for term in terms
+            for j in range(len(term) - 2)
+        ]
+        for ids in sorted(postings, key=len):
+            candidates = set(ids) if candidates is None else candidates.intersection(ids)
+            if not candidates:
+                break
+
+        ids = range(len(self.keys)) if candidates is None else sorted(candidates)
+        result = [i for i in ids if self.matches(rows, i, free_text, column_terms)]
+        self.last_query = query
+        self.last_result = result
+        return result
+
+    def matches(self, rows, i, free_text, column_terms):
+        if free_text and free_text not in self.keys[i]:
+            return False
+        for col, term in column_terms.items():
+            keys = self.column_keys.get(col)
+            key = keys[i] if keys is not None else normalize_text(rows[i][col])
+            if term not in key:
+                return False
+        return True
+
+    def narrows(self, old, new):
+        # True when every term of the new query contains the matching old term,
+        # so the new result can only be a subset of the old one
+        old_free, old_columns = old
+        new_free, new_columns = new
+        if old_free not in new_free:
+            return False
+        return all(col in new_columns and term in new_columns[col] for col, term in old_columns.items())
+
+    def invalidate(self):
+        self.last_query = None
+        self.last_result = None
+
+
+def scan_rows(rows, text):
+    # Linear search used while no index is available yet
+    free_text, column_terms = parse_search(text)
+    result = []
+    for i, row in enumerate(rows):
+        if free_text and not any(free_text in normalize_text(row[col]) for col in SEARCH_COLUMNS):
+            continue
+        if all(term in normalize_text(row[col]) for col, term in column_terms.items()):
+            result.append(i)
+    return result
+
+
+# Null sentinels per column kind, they sort before every real value
+NULL_VALUES = {"date": 0, "number": float("-inf"), "text": ""}
+
+
+def column_kind(value):
+    if isinstance(value, datetime.date):
+        return "date"
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return "number"
+    return "text"
+
+
+def encode_value(kind, value):
+    if value is None or value == "":
+        return NULL_VALUES[kind]
+    if kind == "date":
+        return value.toordinal() if isinstance(value, datetime.date) else 0
+    if kind == "number":
+        return float(value)
+    return value if isinstance(value, str) else str(value)
+
+
+def new_column(kind, length):
+    if kind == "date":
+        return array("l", [0]) * length
+    if kind == "number":
+        return array("d", [NULL_VALUES["number"]]) * length
+    return [""] * length
+
+
+def prepare_rows(rows):
+    # Keep the values typed, tksheet turns a cell into text only when it draws it.
+    # Strings are interned since codes, suppliers and states repeat a lot.
+    return [
+        [sys.intern(value) if isinstance(value, str) else value for value in row]
+        for row in rows
+    ]
+
+
+class TableModel:
+    # Column-oriented view of the loaded rows. rows keeps the original values for the
+    # sheet, columns holds the typed copy used for sorting: dates as ordinals, numbers
+    # as doubles and strings interned. Non-empty counts are kept up to date so hiding
+    # empty columns does not need to scan the rows.
+    def __init__(self, width):
+        self.width = width
+        self.rows = []
+        self.kinds = [None] * width
+        self.columns = [None] * width
+        self.non_empty = [0] * width
+        self.uid_index = {}
+        self.sort_cache = {}
+
+    def extend(self, rows):
+        start = len(self.rows)
+        self.rows.extend(rows)
+        for col in range(self.width):
+            values = [row[col] for row in rows]
+            present = [value for value in values if value is not None and value != ""]
+            if not present:
+                if self.columns[col] is not None:
+                    self.columns[col].extend(new_column(self.kinds[col], len(values)))
+                continue
+            if self.kinds[col] is None:
+                # First real value decides the kind, earlier rows were all empty
+                self.kinds[col] = column_kind(present[0])
+                self.columns[col] = new_column(self.kinds[col], start)
+            kind = self.kinds[col]
+            self.columns[col].extend([encode_value(kind, value) for value in values])
+            self.non_empty[col] += len(present)
+        for i, row in enumerate(rows, start):
+            self.uid_index.setdefault(row[0], []).append(i)
+        self.sort_cache.clear()
+
+    def set_value(self, i, col, value):
+        self.rows[i][col] = value
+        present = value is not None and value != ""
+        if self.kinds[col] is None:
+            if not present:
+                return
+            self.kinds[col] = column_kind(value)
+            self.columns[col] = new_column(self.kinds[col], len(self.rows))
+        kind = self.kinds[col]
+        column = self.columns[col]
+        # Compare against the typed copy, the row itself may already hold the new value
+        was_present = column[i] != NULL_VALUES[kind]
+        column[i] = encode_value(kind, value)
+        self.non_empty[col] += present - was_present
+        for keys in [keys for keys in self.sort_cache if any(c == col for c, _ in keys)]:
+            del self.sort_cache[keys]
+
+    def sorted_ids(self, keys, ids=None):
+        # keys is a sequence of (column, descending); the full permutation is cached and
+        # subsets are ordered by their rank in it
+        keys = tuple(keys)
+        cached = self.sort_cache.get(keys)
+        if cached is None:
+            perm = list(range(len(self.rows)))
+            for col, descending in reversed(keys):
+                column = self.columns[col]
+                if column is not None:
+                    perm.sort(key=column.__getitem__, reverse=descending)
+            rank = array("l", [0]) * len(perm)
+            for position, i in enumerate(perm):
+                rank[i] = position
+            cached = self.sort_cache[keys] = (perm, rank)
+        perm, rank = cached
+        if ids is None:
+            return perm
+        return sorted(ids, key=rank.__getitem__)
+
+    def non_empty_counts(self, ids=None):
+        if ids is None:
+            return list(self.non_empty)
+        counts = []
+        for col in range(self.width):
+            column = self.columns[col]
+            if column is None:
+                counts.append(0)
+                continue
+            null = NULL_VALUES[self.kinds[col]]
+            counts.append(sum(1 for i in ids if column[i] != null))
+        return counts
+
+
+def merge_rows(rows, buckets, fresh_rows):
+    # Replace every row of the changed buckets, keeping the order of rows that survive
+    fresh = {}
+    for row in fresh_rows:
+        fresh.setdefault(row[0], []).append(row)
+    merged = []
+    for row in rows:
+        uid = row[0]
+        if uid_bucket(uid) not in buckets:
+            merged.append(row)
+        elif uid in fresh:
+            merged.extend(fresh.pop(uid))
+    for new_rows in fresh.values():
+        merged.extend(new_rows)
+    return merged
@@ -0,0 +1,212 @@
+import csv
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+from flask import Flask, Response, jsonify, request
+
+from socc_db import (
+    DB_ERRORS, MAX_TRACKING_UIDS, NOC_COLUMNS, NOC_ORDER_BY, NOC_QUERY, OC_COLUMNS, OC_QUERY, TRACKING_STATES,
+    StreamedQuery, close_pool, encode_json_value, upsert_tracking,
+)
+
+# Optional read-through cache in front of SQL Server. Each tab query runs once per TTL
+# for every desktop pointed at it with SOCC_SERVICE_URL, and any write through
+# /tracking drops the cached results. Every request must carry the shared
+# SOCC_SERVICE_TOKEN as "Authorization: Bearer <token>".
+#
+# python socc_service.py starts Werkzeug's development server, which is meant for
+# trying the service out. In production run create_app() under a WSGI server such as
+# waitress or gunicorn, behind TLS since the token travels in every request.
+load_dotenv('.env' if os.path.isfile('.env') else '_internal/.env')
+
+CACHE_TTL = float(os.getenv('SOCC_SERVICE_TTL', '60'))
+SERVICE_TOKEN = os.getenv('SOCC_SERVICE_TOKEN')
+CHUNK_SIZE = 64 * 1024
+
+TAB_QUERIES = {
+    "oc": (OC_QUERY, OC_COLUMNS),
+    "noc": (NOC_QUERY + NOC_ORDER_BY, NOC_COLUMNS),
+}
+
+
+class CachedTab:
+    # One loaded tab. The NDJSON body is built right away since its hash is the ETag,
+    # the CSV body and the gzip copies are built the first time they are asked for.
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.loaded_at = time.monotonic()
+        self.bodies = {"ndjson": b"".join(
+            json.dumps(row, default=encode_json_value, separators=(",", ":")).encode() + b"\n"
+            for row in rows
+        )}
+        self.rows = rows
+        self.etag = hashlib.sha1(self.bodies["ndjson"]).hexdigest()
+        self._lock = threading.Lock()
+
+    def body(self, fmt, gzipped):
+        key = (fmt, gzipped)
+        with self._lock:
+            body = self.bodies.get(key)
+            if body is None:
+                body = self.bodies.get(fmt)
+                if body is None:
+                    body = self.bodies[fmt] = self.encode_csv()
+                if gzipped:
+                    body = self.bodies[key] = gzip.compress(body, compresslevel=6)
+            return body
+
+    def encode_csv(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow([name.strip("[]") for name in self.columns])
+        for row in self.rows:
+            writer.writerow(["" if value is None else value for value in row])
+        return out.getvalue().encode("utf-8")
+
+
+class ResultCache:
+    # Shared by every request thread. A tab is loaded by one request at a time, the
+    # others wait for it instead of running the same query again.
+    def __init__(self, loader, ttl=CACHE_TTL):
+        self.loader = loader
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load_locks = {tab: threading.Lock() for tab in TAB_QUERIES}
+
+    def get(self, tab):
+        entry = self._fresh(tab)
+        if entry is not None:
+            return entry
+        with self._load_locks[tab]:
+            entry = self._fresh(tab)
+            if entry is not None:
+                return entry
+            generation = self.generation
+            query, columns = TAB_QUERIES[tab]
+            start = time.perf_counter()
+            entry = CachedTab(columns, self.loader(query))
+            logging.info(f"Loaded {tab}: {len(entry.rows)} rows in {time.perf_counter() - start:.2f}s")
+            with self._lock:
+                # A write while the query ran may not be in these rows, serve them once
+                # but do not keep them
+                if generation == self.generation:
+                    self._entries[tab] = entry
+            return entry
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def _fresh(self, tab):
+        with self._lock:
+            entry = self._entries.get(tab)
+            if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+                return entry
+            return None
+
+
+def load_rows(query):
+    rows = []
+    for batch in StreamedQuery(query).batches():
+        rows.extend(list(row) for row in batch)
+    return rows
+
+
+def create_app(cache=None, token=None):
+    token = token or SERVICE_TOKEN
+    if not token:
+        # The tabs hold ERP data and /tracking writes to it, never serve them openly
+        raise RuntimeError("SOCC_SERVICE_TOKEN must be set to run the service")
+    app = Flask(__name__)
+    cache = cache or ResultCache(load_rows)
+    mimetypes = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+    expected = f"Bearer {token}".encode()
+
+    @app.before_request
+    def check_token():
+        given = request.headers.get("Authorization", "").encode()
+        if not hmac.compare_digest(given, expected):
+            return jsonify(error="Unauthorized"), 401, {"WWW-Authenticate": "Bearer"}
+
+    @app.get("/tabs/<tab>")
+    def get_tab(tab):
+        if tab not in TAB_QUERIES:
+            return jsonify(error=f"Unknown tab {tab}"), 404
+        fmt = request.args.get("format", "ndjson")
+        if fmt not in mimetypes:
+            return jsonify(error=f"Unknown format {fmt}"), 400
+        try:
+            entry = cache.get(tab)
+        except DB_ERRORS as e:
+            print(f"An error occurred while loading {tab}: {str(e)}", file=sys.stderr)
+            return jsonify(error="Database unavailable"), 503
+
+        headers = {"ETag": f'"{entry.etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if request.if_none_match.contains(entry.etag):
+            return Response(status=304, headers=headers)
+        gzipped = "gzip" in request.accept_encodings
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+        body = entry.body(fmt, gzipped)
+        headers["Content-Length"] = str(len(body))
+
+        def chunks():
+            for start in range(0, len(body), CHUNK_SIZE):
+                yield body[start:start + CHUNK_SIZE]
+
+        return Response(chunks(), mimetype=mimetypes[fmt], headers=headers)
+
+    @app.post("/tracking")
+    def save_tracking():
+        payload = request.get_json(silent=True) or {}
+        uids = payload.get("uids")
+        ocfstate = payload.get("ocfstate")
+        comments = payload.get("comments")
+        insert_only = bool(payload.get("insert_only"))
+        if not isinstance(uids, list) or not all(isinstance(uid, str) and uid.strip() for uid in uids):
+            return jsonify(error="uids must be a list of UIDs"), 400
+        if len(uids) > MAX_TRACKING_UIDS:
+            return jsonify(error=f"At most {MAX_TRACKING_UIDS} uids per request"), 400
+        # Same values the desktop offers. A missing field is left as it is and editing may
+        # clear the state, but records are only ever inserted with one.
+        if insert_only and ocfstate not in TRACKING_STATES:
+            return jsonify(error="Creating records requires an ocfstate"), 400
+        if ocfstate not in TRACKING_STATES and ocfstate not in (None, ""):
+            return jsonify(error="Unknown ocfstate"), 400
+        if comments is not None and not isinstance(comments, str):
+            return jsonify(error="comments must be a string"), 400
+        try:
+            inserted, updated = upsert_tracking(uids, ocfstate, comments, insert_only=insert_only)
+        except DB_ERRORS as e:
+            print(f"An error occurred while saving tracking records: {str(e)}", file=sys.stderr)
+            return jsonify(error="Database unavailable"), 503
+        if inserted or updated:
+            cache.invalidate()
+        return jsonify(inserted=inserted, updated=updated)
+
+    return app
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.warning("Running on the Werkzeug development server, use a WSGI server in production")
+    try:
+        create_app().run(
+            host=os.getenv('SOCC_SERVICE_HOST', '127.0.0.1'),
+            port=int(os.getenv('SOCC_SERVICE_PORT', '8050')),
+            threaded=True,
+        )
+    finally:
+        close_pool()
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import zlib
+
+from cryptography.fernet import InvalidToken
+
+from socc_db import decode_json_value, encode_json_value
+from socc_model import prepare_rows
+
+# Bump when the payload format changes, older snapshots are then ignored
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotStore:
+    # Local snapshot of each tab so the window can show data before the server answers.
+    # One row per tab in a local SQLite file. The rows are stored as compressed JSON
+    # encrypted with fernet, the app passes the key of its saved credentials.
+    def __init__(self, path, fernet, max_bytes):
+        self.path = path
+        self.fernet = fernet
+        self.max_bytes = max_bytes
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "tab TEXT PRIMARY KEY, version INTEGER, schema TEXT, saved_at REAL, payload BLOB)"
+        )
+        return conn
+
+    def load(self, tab, schema):
+        try:
+            conn = self.connect()
+            try:
+                row = conn.execute(
+                    "SELECT version, schema, saved_at, payload FROM snapshots WHERE tab = ?", (tab,)
+                ).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                return None
+            version, saved_schema, saved_at, payload = row
+            if version != SNAPSHOT_VERSION or saved_schema != schema:
+                return None
+            data = zlib.decompress(self.fernet.decrypt(payload))
+            rows = json.loads(data, object_hook=decode_json_value)
+            return prepare_rows(rows), saved_at
+        except (sqlite3.Error, zlib.error, ValueError, InvalidToken) as e:
+            logging.warning(f"Ignoring snapshot for {tab}: {e}")
+            return None
+
+    def save(self, tab, schema, rows):
+        try:
+            data = json.dumps(rows, default=encode_json_value, separators=(",", ":"))
+            payload = self.fernet.encrypt(zlib.compress(data.encode(), 6))
+            conn = self.connect()
+            try:
+                if len(payload) > self.max_bytes:
+                    # Too big to keep, drop the old one too since it is now stale
+                    logging.warning(f"Snapshot for {tab} is {len(payload)} bytes, over the limit")
+                    conn.execute("DELETE FROM snapshots WHERE tab = ?", (tab,))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO snapshots (tab, version, schema, saved_at, payload) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (tab, SNAPSHOT_VERSION, schema, time.time(), payload),
+                    )
+                conn.commit()
+            finally:
+                conn.close()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logging.warning(f"Could not save snapshot for {tab}: {e}")
+
+
+def snapshot_schema(query, width):
+    # A changed query or column count invalidates what was stored for it
+    return hashlib.sha256(f"{width}:{query}".encode()).hexdigest()
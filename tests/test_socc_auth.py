@@ -0,0 +1,90 @@
+import pytest
+from ldap3 import MOCK_SYNC, OFFLINE_AD_2012_R2, SIMPLE, Connection, Server
+
+from socc_auth import LdapAuthorizer, parse_allowed_groups
+
+# Same format as ALLOWED_GROUPS in .env: full group DNs joined by commas
+ALLOWED_GROUPS = (
+    "CN=SISTEMAS,OU=SISTEMAS,OU=GBLAB,DC=GBLAB,DC=LOCAL,"
+    "CN=LOGISTICA,OU=LOGISTICA,OU=PRODUCCION Y ABASTECIMIENTO,OU=GBLAB,DC=GBLAB,DC=LOCAL"
+)
+USERS_OU = "OU=USUARIOS,DC=GBLAB,DC=LOCAL"
+
+
+class MockAuthorizer(LdapAuthorizer):
+    # The mock server only supports SIMPLE binds, which take a DN instead of DOMAIN\user
+    def bind_user(self, username):
+        return f"CN={username},{USERS_OU}"
+
+
+@pytest.fixture
+def server():
+    server = Server("mock_ad", get_info=OFFLINE_AD_2012_R2)
+    seed = Connection(server, client_strategy=MOCK_SYNC)
+    users = {
+        "ana": ["CN=SISTEMAS,OU=SISTEMAS,OU=GBLAB,DC=GBLAB,DC=LOCAL"],
+        "luis": ["CN=Ventas,OU=GBLAB,DC=GBLAB,DC=LOCAL",
+                 "CN=LOGISTICA,OU=LOGISTICA,OU=PRODUCCION Y ABASTECIMIENTO,OU=GBLAB,DC=GBLAB,DC=LOCAL"],
+        "eva": ["CN=Ventas,OU=GBLAB,DC=GBLAB,DC=LOCAL"],
+        "jefe": ["CN=Ventas,OU=GBLAB,DC=GBLAB,DC=LOCAL"],
+    }
+    for name, groups in users.items():
+        seed.strategy.add_entry(f"CN={name},{USERS_OU}", {
+            "userPassword": "clave",
+            "sAMAccountName": name,
+            "memberOf": groups,
+            "objectClass": "person",
+        })
+    return server
+
+
+def make_authorizer(server, **kwargs):
+    return MockAuthorizer(
+        server,
+        "gblab.local",
+        allowed_users=["jefe"],
+        allowed_groups=parse_allowed_groups(ALLOWED_GROUPS),
+        authentication=SIMPLE,
+        client_strategy=MOCK_SYNC,
+        **kwargs,
+    )
+
+
+def test_parse_allowed_groups_splits_dns():
+    assert parse_allowed_groups(ALLOWED_GROUPS) == [
+        "CN=SISTEMAS,OU=SISTEMAS,OU=GBLAB,DC=GBLAB,DC=LOCAL",
+        "CN=LOGISTICA,OU=LOGISTICA,OU=PRODUCCION Y ABASTECIMIENTO,OU=GBLAB,DC=GBLAB,DC=LOCAL",
+    ]
+    assert parse_allowed_groups("Compras, Sistemas") == ["Compras", "Sistemas"]
+
+
+def test_group_members_and_allowed_users_log_in(server):
+    authorizer = make_authorizer(server)
+    assert authorizer.authenticate("ana", "clave")
+    assert authorizer.authenticate("luis", "clave")
+    assert authorizer.authenticate("jefe", "clave")
+    assert not authorizer.authenticate("eva", "clave")
+
+
+def test_wrong_or_empty_password_is_denied(server):
+    authorizer = make_authorizer(server)
+    assert not authorizer.authenticate("ana", "otra")
+    assert not authorizer.authenticate("ana", "")
+    assert not authorizer.authenticate("nadie", "clave")
+
+
+def test_bare_group_names_match_by_cn(server):
+    authorizer = make_authorizer(server)
+    authorizer.allowed_groups = {"sistemas"}
+    assert authorizer.authenticate("ana", "clave")
+    assert not authorizer.authenticate("luis", "clave")
+
+
+def test_decision_is_cached_until_invalidated(server):
+    authorizer = make_authorizer(server, cache_ttl=300)
+    assert not authorizer.authenticate("eva", "clave")
+    authorizer.allowed_groups.add("ventas")
+    # Still denied from the cache, the password is checked again though
+    assert not authorizer.authenticate("eva", "clave")
+    authorizer.invalidate("eva")
+    assert authorizer.authenticate("eva", "clave")
@@ -0,0 +1,36 @@
+import pytest
+
+from socc_client import ServiceClient, ServiceError
+from socc_db import MAX_TRACKING_UIDS
+
+
+def test_upsert_tracking_splits_large_saves(monkeypatch):
+    client = ServiceClient("http://socc", token="secreto")
+    calls = []
+
+    def post_tracking(uids, ocfstate, comments, insert_only):
+        calls.append((len(uids), ocfstate, comments, insert_only))
+        return uids[:1], uids[1:]
+
+    monkeypatch.setattr(client, "post_tracking", post_tracking)
+    uids = [f"U{i}" for i in range(MAX_TRACKING_UIDS * 2 + 1)]
+    inserted, updated = client.upsert_tracking(uids, "Cartera", None, insert_only=True)
+    assert [call[0] for call in calls] == [MAX_TRACKING_UIDS, MAX_TRACKING_UIDS, 1]
+    assert all(call[1:] == ("Cartera", None, True) for call in calls)
+    assert inserted == [uids[0], uids[MAX_TRACKING_UIDS], uids[-1]]
+    assert sorted(inserted + updated) == sorted(uids)
+
+
+def test_upsert_tracking_reports_what_was_saved_before_a_failure(monkeypatch):
+    client = ServiceClient("http://socc")
+    calls = []
+
+    def post_tracking(uids, ocfstate, comments, insert_only):
+        calls.append(uids)
+        if len(calls) > 1:
+            raise ServiceError("tracking: HTTP 503 SERVICE UNAVAILABLE")
+        return [], uids
+
+    monkeypatch.setattr(client, "post_tracking", post_tracking)
+    with pytest.raises(ServiceError, match=f"{MAX_TRACKING_UIDS} records already saved"):
+        client.upsert_tracking([f"U{i}" for i in range(MAX_TRACKING_UIDS + 1)], None, "nota")
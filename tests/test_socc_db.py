@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+
+import pytest
+
+from socc_db import ConnectionPool, PagedQuery, PoolTimeout, SQLiteBackend, StreamedQuery, fetch_all, tracking_merge
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(SQLiteBackend(str(tmp_path / "socc.db")), max_size=2, timeout=0.2)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE items (UID TEXT, CODE TEXT, QTY INTEGER)")
+        conn.executemany(
+            "INSERT INTO items VALUES (?, ?, ?)",
+            [(f"U{i:03d}", None if i % 7 == 0 else f"C{i % 5}", i % 3) for i in range(25)],
+        )
+        conn.commit()
+    yield pool
+    pool.close()
+
+
+def test_pool_reuses_connections(pool):
+    for _ in range(5):
+        with pool.connection() as conn:
+            conn.execute("SELECT 1").fetchone()
+    stats = pool.get_stats()
+    assert stats["connects"] == 1
+    assert stats["reuses"] >= 5
+    assert stats["idle"] == 1
+
+
+def test_pool_shared_between_threads(pool):
+    def work():
+        for _ in range(20):
+            pool.run(lambda conn: conn.execute("SELECT COUNT(*) FROM items").fetchone())
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pool.get_stats()["connects"] <= pool.max_size
+
+
+def test_pool_times_out_when_exhausted(pool):
+    first, second = pool.acquire(), pool.acquire()
+    try:
+        with pytest.raises(PoolTimeout):
+            pool.acquire()
+    finally:
+        pool.release(first)
+        pool.release(second)
+
+
+def test_pool_waits_for_a_released_connection(pool):
+    first, second = pool.acquire(), pool.acquire()
+    timer = threading.Timer(0.05, pool.release, args=(first,))
+    timer.start()
+    conn = pool.acquire()
+    pool.release(conn)
+    pool.release(second)
+    timer.join()
+    assert pool.get_stats()["waits"] == 1
+
+
+def test_pool_discards_broken_connections(pool):
+    with pytest.raises(sqlite3.ProgrammingError):
+        with pool.connection():
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+    stats = pool.get_stats()
+    assert stats["discarded"] == 1
+    assert stats["size"] == 0
+
+
+def test_streamed_query_batches(pool):
+    stream = StreamedQuery("SELECT UID FROM items ORDER BY UID", batch_size=10, pool=pool)
+    batches = list(stream.batches())
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert [row[0] for batch in batches for row in batch] == [f"U{i:03d}" for i in range(25)]
+    assert pool.get_stats()["idle"] == 1
+
+
+def test_streamed_query_cancelled_before_start(pool):
+    stream = StreamedQuery("SELECT UID FROM items", batch_size=10, pool=pool)
+    stream.cancel()
+    assert list(stream.batches()) == []
+
+
+def drop_idle_connection(pool):
+    # The server dropped the link while the connection sat in the pool
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close()
+
+
+def test_streamed_query_reconnects_before_the_first_batch(pool):
+    drop_idle_connection(pool)
+    stream = StreamedQuery("SELECT UID FROM items", batch_size=10, pool=pool)
+    assert sum(len(batch) for batch in stream.batches()) == 25
+    stats = pool.get_stats()
+    assert stats["discarded"] == 1
+    assert stats["connects"] == 2
+
+
+def test_one_shot_fetches_reconnect(pool):
+    drop_idle_connection(pool)
+    assert PagedQuery("SELECT UID, CODE, QTY FROM items", ["UID", "CODE", "QTY"]).count(pool) == 25
+    assert fetch_all("SELECT COUNT(*) FROM items WHERE QTY = ?", [1], pool) == [(8,)]
+    assert pool.get_stats()["discarded"] == 1
+
+
+@pytest.mark.parametrize("sort_keys", [(), [(1, False)], [(1, True)], [(2, False), (1, True)]])
+def test_paged_query_ranges_cover_the_full_order(pool, sort_keys):
+    # Repeated UIDs, like the NOC join returns, must not make pages skip or repeat rows.
+    # As there, the repeats differ in one column or not at all.
+    with pool.connection() as conn:
+        conn.executemany("INSERT INTO items VALUES (?, ?, ?)", [("U001", "C1", 2), ("U001", "C1", 1), ("U002", "C2", 2)])
+        conn.commit()
+    paged = PagedQuery("SELECT UID, CODE, QTY FROM items", ["UID", "CODE", "QTY"], sort_keys, tie_columns=[0, 2])
+    count = paged.count(pool)
+    assert count == 28
+
+    pages = []
+    for start in range(0, count, 4):
+        pages.extend(paged.fetch_range(start, 4, pool))
+    assert pages == paged.fetch_range(0, count, pool)
+    assert sorted(map(tuple, pages), key=repr) == sorted(
+        pool.run(lambda conn: conn.execute("SELECT UID, CODE, QTY FROM items").fetchall()), key=repr)
+
+    # Rows come back in the requested order, nulls first when ascending
+    for col, descending in sort_keys[:1]:
+        keys = [(row[col] is not None, row[col] or 0) for row in pages]
+        assert keys == sorted(keys, reverse=descending)
+
+
+def test_tracking_merge_writes_only_given_fields():
+    query, params = tracking_merge("Cartera", "nota")
+    assert "UPDATE SET OCFSTATE = ?, COMMENTS = ?" in query
+    assert "INSERT (UID, OCFSTATE, COMMENTS) VALUES (s.UID, ?, ?)" in query
+    assert params == ["Cartera", "nota", "Cartera", "nota"]
+
+    query, params = tracking_merge(None, "nota")
+    assert "UPDATE SET COMMENTS = ?" in query
+    assert "NOT MATCHED" not in query
+    assert params == ["nota"]
+
+    # Without a state nothing is inserted, not even when the state is cleared
+    query, params = tracking_merge("", "nota")
+    assert "NOT MATCHED" not in query
+
+    query, params = tracking_merge("Diseño", None, insert_only=True)
+    assert "WHEN MATCHED" not in query
+    assert "INSERT (UID, OCFSTATE) VALUES (s.UID, ?)" in query
+    assert params == ["Diseño"]
+
+    assert tracking_merge(None, None) is None
+    assert tracking_merge(None, "nota", insert_only=True) is None
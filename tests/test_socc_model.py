@@ -0,0 +1,93 @@
+import datetime
+import random
+from decimal import Decimal
+
+from socc_db import uid_bucket
+from socc_model import SearchIndex, TableModel, merge_rows, scan_rows
+
+WORDS = ["diseño", "Cartera", "ACME", "acmé", "tornillo", "900123", "Homologación", "caja"]
+
+
+def make_rows(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        rows.append([
+            f"OC{i:05d}",
+            f"{rng.randint(1, 40)}",
+            f"IT{rng.randint(1, 300)}",
+            " ".join(rng.sample(WORDS, 2)),
+            rng.choice(["900123", "800456", None]),
+            rng.choice(["ACME SAS", "Diseños Ltda", "Tornillos y Cía", None]),
+            Decimal(rng.randint(0, 50)),
+            None,
+            datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randint(0, 90)),
+            None,
+            "ABIERTA",
+            rng.choice(["Cartera", "Diseño", None]),
+            "",
+        ])
+    return rows
+
+
+def test_search_index_matches_scan():
+    rows = make_rows(2000)
+    index = SearchIndex(rows)
+    queries = [
+        "dis", "dise", "diseno", "DISEÑO", "acme", "nit:900", "nit:900123", "proveedor:acme",
+        "proveedor:acme tornillo", "estado:cart", "xyz", "", "oc:1", 'proveedor:"y cia"',
+    ]
+    for query in queries:
+        assert index.search(rows, query) == scan_rows(rows, query), query
+
+
+def test_search_index_after_invalidate():
+    rows = make_rows(300)
+    index = SearchIndex(rows)
+    assert index.search(rows, "estado:car") == scan_rows(rows, "estado:car")
+    rows[0][11] = "Cartera"
+    index.invalidate()
+    assert index.search(rows, "estado:cart") == scan_rows(rows, "estado:cart")
+
+
+def test_table_model_set_value_tracks_non_empty():
+    rows = make_rows(50)
+    model = TableModel(13)
+    model.extend(rows[:20])
+    model.extend(rows[20:])
+    assert model.non_empty[12] == 0
+    assert model.non_empty[11] == sum(1 for row in rows if row[11])
+
+    model.set_value(3, 12, "comentario")
+    model.set_value(3, 12, "otro")
+    assert model.non_empty[12] == 1
+    model.set_value(3, 12, "")
+    assert model.non_empty[12] == 0
+    assert model.rows[3][12] == ""
+
+    before = model.non_empty[11]
+    target = next(i for i, row in enumerate(rows) if row[11] is None)
+    model.set_value(target, 11, "Cartera")
+    assert model.non_empty[11] == before + 1
+    assert model.non_empty_counts([target])[11] == 1
+
+
+def test_table_model_sort_follows_set_value():
+    rows = make_rows(100)
+    model = TableModel(13)
+    model.extend(rows)
+    expected = sorted(range(100), key=lambda i: rows[i][8])
+    assert [rows[i][8] for i in model.sorted_ids([(8, False)])] == [rows[i][8] for i in expected]
+
+    model.set_value(0, 8, datetime.date(2000, 1, 1))
+    assert model.sorted_ids([(8, False)])[0] == 0
+    assert model.sorted_ids([(8, True)], ids=[0, 1, 2])[-1] == 0
+
+
+def test_merge_rows_replaces_changed_buckets():
+    rows = [["AB01", "old"], ["AB02", "keep"], ["CD01", "old"], ["CD01", "old dup"]]
+    bucket = uid_bucket("AB01")
+    fresh = [["AB01", "new"], ["CD01", "new"], ["EF01", "added"]]
+    assert uid_bucket("CD01") == bucket
+    merged = merge_rows(rows, {bucket}, fresh)
+    assert merged == [["AB01", "new"], ["AB02", "keep"], ["CD01", "new"], ["EF01", "added"]]
@@ -0,0 +1,82 @@
+import datetime
+import gzip
+import json
+from decimal import Decimal
+
+import pytest
+
+import socc_service
+
+TOKEN = "secreto"
+AUTH = {"Authorization": f"Bearer {TOKEN}"}
+
+
+@pytest.fixture
+def loads():
+    return []
+
+
+@pytest.fixture
+def client(loads, monkeypatch):
+    def loader(query):
+        loads.append(query)
+        return [[f"U{i}", "OC1", Decimal("2.50"), datetime.date(2024, 1, 2)] for i in range(3)]
+
+    saved = []
+
+    def fake_upsert(uids, ocfstate, comments, insert_only=False):
+        saved.append((uids, ocfstate, comments, insert_only))
+        return uids[:1], uids[1:]
+
+    monkeypatch.setattr(socc_service, "upsert_tracking", fake_upsert)
+    app = socc_service.create_app(socc_service.ResultCache(loader, ttl=60), token=TOKEN)
+    client = app.test_client()
+    client.saved = saved
+    return client
+
+
+def test_token_is_required():
+    with pytest.raises(RuntimeError):
+        socc_service.create_app(socc_service.ResultCache(lambda query: []), token="")
+
+
+def test_requests_without_token_are_rejected(client, loads):
+    assert client.get("/tabs/oc").status_code == 401
+    assert client.get("/tabs/oc", headers={"Authorization": "Bearer otro"}).status_code == 401
+    assert client.post("/tracking", json={"uids": ["U1"], "ocfstate": "Cartera"}).status_code == 401
+    assert loads == []
+    assert client.saved == []
+
+
+def test_tab_is_cached_and_supports_etag(client, loads):
+    response = client.get("/tabs/oc", headers=dict(AUTH, **{"Accept-Encoding": "gzip"}))
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert json.loads(lines[0]) == ["U0", "OC1", {"n": "2.50"}, {"d": "2024-01-02"}]
+
+    etag = response.headers["ETag"]
+    again = client.get("/tabs/oc", headers=dict(AUTH, **{"If-None-Match": etag}))
+    assert again.status_code == 304
+    assert len(loads) == 1
+
+
+def test_tracking_validates_and_invalidates(client, loads):
+    client.get("/tabs/oc", headers=AUTH)
+    assert client.post("/tracking", headers=AUTH, json={"uids": ["U1"], "ocfstate": "Otro"}).status_code == 400
+    assert client.post("/tracking", headers=AUTH, json={"uids": ["U1"], "ocfstate": 1}).status_code == 400
+    assert client.post("/tracking", headers=AUTH, json={"uids": ["U1"], "comments": 1}).status_code == 400
+    for ocfstate in ("", None):
+        assert client.post(
+            "/tracking", headers=AUTH, json={"uids": ["U1"], "ocfstate": ocfstate, "insert_only": True}
+        ).status_code == 400
+    assert client.saved == []
+
+    # An edit of the comments alone leaves the state out
+    assert client.post("/tracking", headers=AUTH, json={"uids": ["U1"], "comments": "x"}).status_code == 200
+    assert client.saved[-1] == (["U1"], None, "x", False)
+
+    response = client.post("/tracking", headers=AUTH, json={"uids": ["U1", "U2"], "ocfstate": "Cartera", "comments": "x"})
+    assert response.get_json() == {"inserted": ["U1"], "updated": ["U2"]}
+    client.get("/tabs/oc", headers=AUTH)
+    assert len(loads) == 2
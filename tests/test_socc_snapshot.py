@@ -0,0 +1,71 @@
+import datetime
+import sqlite3
+import zlib
+from decimal import Decimal
+
+import pytest
+from cryptography.fernet import Fernet
+
+import socc_snapshot
+from socc_snapshot import SnapshotStore, snapshot_schema
+
+ROWS = [
+    ["OC001", "12", "IT1", "Tornillo", Decimal("4.50"), datetime.date(2024, 3, 1), None, "Cartera"],
+    ["OC002", "13", "IT2", "Diseño", Decimal("0"), datetime.date(2024, 3, 2), "nota", ""],
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / "snapshot.db"), Fernet(Fernet.generate_key()), 1024 * 1024)
+
+
+def test_snapshot_round_trip(store):
+    schema = snapshot_schema("SELECT * FROM oc", 8)
+    store.save("oc", schema, ROWS)
+    rows, saved_at = store.load("oc", schema)
+    assert rows == ROWS
+    assert saved_at > 0
+    assert store.load("noc", schema) is None
+
+
+def test_snapshot_payload_is_encrypted(store):
+    store.save("oc", snapshot_schema("SELECT * FROM oc", 8), ROWS)
+    conn = sqlite3.connect(store.path)
+    payload = conn.execute("SELECT payload FROM snapshots WHERE tab = 'oc'").fetchone()[0]
+    conn.close()
+    assert b"Tornillo" not in payload
+    other = SnapshotStore(store.path, Fernet(Fernet.generate_key()), store.max_bytes)
+    assert other.load("oc", snapshot_schema("SELECT * FROM oc", 8)) is None
+
+
+def test_snapshot_rejects_other_schema_or_version(store, monkeypatch):
+    schema = snapshot_schema("SELECT * FROM oc", 8)
+    store.save("oc", schema, ROWS)
+    assert store.load("oc", snapshot_schema("SELECT * FROM oc", 9)) is None
+    assert store.load("oc", snapshot_schema("SELECT UID FROM oc", 8)) is None
+    monkeypatch.setattr(socc_snapshot, "SNAPSHOT_VERSION", socc_snapshot.SNAPSHOT_VERSION + 1)
+    assert store.load("oc", schema) is None
+
+
+def test_snapshot_over_the_limit_drops_the_old_one(store):
+    schema = snapshot_schema("SELECT * FROM oc", 8)
+    store.save("oc", schema, ROWS)
+    store.max_bytes = 100
+    store.save("oc", schema, ROWS * 50)
+    assert store.load("oc", schema) is None
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda fernet: b"not a fernet token",
+    lambda fernet: fernet.encrypt(b"not zlib"),
+    lambda fernet: fernet.encrypt(zlib.compress(b"[1, 2")),
+], ids=["token", "zlib", "json"])
+def test_snapshot_ignores_a_corrupt_payload(store, corrupt):
+    schema = snapshot_schema("SELECT * FROM oc", 8)
+    store.save("oc", schema, ROWS)
+    conn = sqlite3.connect(store.path)
+    conn.execute("UPDATE snapshots SET payload = ? WHERE tab = 'oc'", (corrupt(store.fernet),))
+    conn.commit()
+    conn.close()
+    assert store.load("oc", schema) is None